@@ -1,16 +1,21 @@
-"""Interactive phaseogram."""
+"""Folding of event lists and fitting of pulse profiles.
 
+If Numba is installed, the folding kernels are compiled on first use and
+the compiled code is cached to disk (``cache=True``), so that later calls
+to ``HENfold`` and friends do not pay the compilation time again.
+"""
+
+import os
 import warnings
 import copy
+import functools
 import argparse
-from stingray.pulse.pulsar import fold_events, pulse_phase, get_TOA
+from stingray.pulse.pulsar import fold_events, get_TOA
 from stingray.utils import assign_value_if_none
+from stingray.gti import create_gti_mask
 from stingray.events import EventList
 
 import numpy as np
-from scipy.signal import savgol_filter
-from scipy import optimize
-from astropy.stats import poisson_conf_interval
 from astropy import log
 from .io import load_events
 
@@ -34,6 +39,7 @@ except ImportError:
     )
     HAS_PINT = False
 from .base import deorbit_events
+from .base import njit, prange, HAS_NUMBA
 
 
 def _load_and_prepare_TOAs(mjds, errs_us=None, ephem="DE405"):
@@ -315,23 +321,155 @@ def _check_odd(n):
     return n // 2 * 2 + 1
 
 
+def _dbl_cos_basis(x):
+    """Basis vectors of the double sinusoid, as columns of a matrix.
+
+    Since ``A cos(2 pi k x + 2 pi k ph) = A cos(2 pi k ph) cos(2 pi k x) -
+    A sin(2 pi k ph) sin(2 pi k x)``, the model is a linear combination of a
+    constant and of the sines and cosines of the first two harmonics.
+    """
+    twopix = 2 * np.pi * x
+    return np.array(
+        [
+            np.ones_like(x),
+            np.cos(twopix),
+            np.sin(twopix),
+            np.cos(2 * twopix),
+            np.sin(2 * twopix),
+        ]
+    ).T
+
+
+@functools.lru_cache(maxsize=16)
+def _profile_basis(nbin, nperiods):
+    """Cached basis for a profile of ``nbin`` bins spanning ``nperiods``."""
+    x = np.arange(0, nbin * nperiods, nperiods) / float(nbin)
+    basis = _dbl_cos_basis(x)
+    basis.setflags(write=False)
+    return basis
+
+
+def _dbl_cos_coeffs(p):
+    """Coefficients of the model over the basis from ``_dbl_cos_basis``."""
+    startidx = len(p) % 2
+    base = p[0] if startidx == 1 else 0
+    amp1, ph1, amp2, ph2 = p[startidx : startidx + 4]
+    return np.array(
+        [
+            base,
+            amp1 * np.cos(2 * np.pi * ph1),
+            -amp1 * np.sin(2 * np.pi * ph1),
+            amp2 * np.cos(4 * np.pi * ph2),
+            -amp2 * np.sin(4 * np.pi * ph2),
+        ]
+    )
+
+
+def _dbl_cos_pars_from_coeffs(coeffs, baseline=False):
+    """Inverse of ``_dbl_cos_coeffs``."""
+    base, a1, b1, a2, b2 = coeffs
+    pars = [
+        np.hypot(a1, b1),
+        np.arctan2(-b1, a1) / (2 * np.pi),
+        np.hypot(a2, b2),
+        np.arctan2(-b2, a2) / (4 * np.pi),
+    ]
+    if baseline:
+        pars = [base] + pars
+    return pars
+
+
+def _dbl_cos_linear_fit(profile, basis, baseline=False):
+    """Least-squares fit of the profile, solved in closed form.
+
+    Examples
+    --------
+    >>> x = np.arange(0, 1, 1 / 32)
+    >>> profile = 3 + 2 * np.cos(2 * np.pi * (x + 0.1))
+    >>> profile += 0.5 * np.cos(4 * np.pi * (x - 0.2))
+    >>> pars = _dbl_cos_linear_fit(profile, _dbl_cos_basis(x), baseline=True)
+    >>> np.allclose(pars, [3, 2, 0.1, 0.5, -0.2])
+    True
+    """
+    if not baseline:
+        basis = basis[:, 1:]
+    coeffs = np.linalg.lstsq(basis, profile, rcond=None)[0]
+    if not baseline:
+        coeffs = np.concatenate(([0], coeffs))
+    return _dbl_cos_pars_from_coeffs(coeffs, baseline=baseline)
+
+
+def _dbl_cos_fft_fit(profile, nperiods=1, baseline=False):
+    """Same as ``_dbl_cos_linear_fit``, from the FFT of the profile.
+
+    On a uniform grid spanning an integer number of periods, the columns of
+    the basis are orthogonal, and the least-squares coefficients are just
+    the Fourier amplitudes at ``nperiods`` and ``2 * nperiods``. This is
+    only true if both harmonics are below the Nyquist frequency
+    (``4 * nperiods < len(profile)``)
+
+    Examples
+    --------
+    >>> x = np.arange(0, 1, 1 / 32)
+    >>> profile = 3 + 2 * np.cos(2 * np.pi * (x + 0.1))
+    >>> profile += 0.5 * np.cos(4 * np.pi * (x - 0.2))
+    >>> pars = _dbl_cos_fft_fit(profile, baseline=True)
+    >>> np.allclose(pars, [3, 2, 0.1, 0.5, -0.2])
+    True
+    >>> noisy = np.random.poisson(profile * 10) / 10
+    >>> np.allclose(
+    ...     _dbl_cos_fft_fit(noisy),
+    ...     _dbl_cos_linear_fit(noisy, _profile_basis(32, 1)))
+    True
+    """
+    nbin = len(profile)
+    ft = np.fft.rfft(profile)
+    # For a * cos + b * sin on the grid, ft[k] = nbin / 2 * (a - i b)
+    harm = ft[[nperiods, 2 * nperiods]] * (2 / nbin)
+    coeffs = [
+        ft[0].real / nbin,
+        harm[0].real,
+        -harm[0].imag,
+        harm[1].real,
+        -harm[1].imag,
+    ]
+    return _dbl_cos_pars_from_coeffs(coeffs, baseline=baseline)
+
+
+def _dbl_cos_fit_func_from_basis(p, basis):
+    return basis @ _dbl_cos_coeffs(p)
+
+
+def _dbl_cos_residuals(p, basis, y):
+    return _dbl_cos_fit_func_from_basis(p, basis) - y
+
+
+def _dbl_cos_jacobian(p, basis, y):
+    startidx = len(p) % 2
+    amp1, ph1, amp2, ph2 = p[startidx : startidx + 4]
+    cos1, sin1 = np.cos(2 * np.pi * ph1), np.sin(2 * np.pi * ph1)
+    cos2, sin2 = np.cos(4 * np.pi * ph2), np.sin(4 * np.pi * ph2)
+
+    jac = np.empty((basis.shape[0], len(p)))
+    if startidx == 1:
+        jac[:, 0] = 1
+    jac[:, startidx] = cos1 * basis[:, 1] - sin1 * basis[:, 2]
+    jac[:, startidx + 1] = (
+        -2 * np.pi * amp1 * (sin1 * basis[:, 1] + cos1 * basis[:, 2])
+    )
+    jac[:, startidx + 2] = cos2 * basis[:, 3] - sin2 * basis[:, 4]
+    jac[:, startidx + 3] = (
+        -4 * np.pi * amp2 * (sin2 * basis[:, 3] + cos2 * basis[:, 4])
+    )
+    return jac
+
+
 def dbl_cos_fit_func(p, x):
     # the frequency is fixed
     """
     A double sinus (fundamental + 1st harmonic) used as a fit function
     """
-    startidx = 0
-    base = 0
-    if len(p) % 2 != 0:
-        base = p[0]
-        startidx = 1
-    first_harm = p[startidx] * np.cos(
-        2 * np.pi * x + 2 * np.pi * p[startidx + 1]
-    )
-    second_harm = p[startidx + 2] * np.cos(
-        4.0 * np.pi * x + 4 * np.pi * p[startidx + 3]
-    )
-    return base + first_harm + second_harm
+    return _dbl_cos_fit_func_from_basis(p, _dbl_cos_basis(x))
 
 
 def std_fold_fit_func(p, x):
@@ -345,6 +483,24 @@ def std_residuals(p, x, y):
     return std_fold_fit_func(p, x) - y
 
 
+def std_jacobian(p, x, y):
+    """The Jacobian of the residual function used in the fit.
+
+    Examples
+    --------
+    >>> x = np.arange(0, 1, 0.01)
+    >>> p = np.array([1., 0.5, 0.2, 0.1, 0.3])
+    >>> y = np.zeros_like(x)
+    >>> jac = std_jacobian(p, x, y)
+    >>> dp = np.zeros_like(p)
+    >>> dp[2] = 1e-7
+    >>> num = (std_residuals(p + dp, x, y) - std_residuals(p, x, y)) / 1e-7
+    >>> np.allclose(jac[:, 2], num, atol=1e-5)
+    True
+    """
+    return _dbl_cos_jacobian(p, _dbl_cos_basis(x), y)
+
+
 def adjust_amp_phase(pars):
     """Give the phases in the interval between 0 and 1.
     The calculation is based on the amplitude and phase given as input
@@ -364,13 +520,88 @@ def adjust_amp_phase(pars):
     return pars
 
 
+@njit(nogil=True, cache=True)
+def _adjust_amp_phase_inplace(pars, startidx):
+    """Same as ``adjust_amp_phase``, on ``pars[startidx:startidx + 2]``."""
+    amp = pars[startidx]
+    phase = pars[startidx + 1]
+    if amp < 0:
+        amp = -amp
+        phase += 0.5
+    if phase < -1:
+        phase += np.floor(-phase)
+    if phase > 1:
+        phase -= np.floor(phase)
+    pars[startidx] = amp
+    pars[startidx + 1] = phase - np.ceil(phase)
+
+
+# error_model="numpy": zero errors give inf or nan, as in numpy, instead
+# of raising ZeroDivisionError
+@njit(nogil=True, error_model="numpy", cache=True)
+def _reduced_chisq_numba(profile, model, profile_err, ndof):
+    chisq = 0.0
+    for i in range(profile.size):
+        res = (profile[i] - model[i]) / profile_err[i]
+        chisq += res * res
+    return chisq / ndof
+
+
+def _reduced_chisq(profile, model, profile_err, ndof):
+    """Reduced chi^2 of the model, in a single loop if Numba is present.
+
+    Examples
+    --------
+    >>> profile = np.array([1., 2., 3.])
+    >>> model = np.array([1., 1., 1.])
+    >>> err = np.array([1., 1., 2.])
+    >>> np.isclose(_reduced_chisq(profile, model, err, 2), 1)
+    True
+    >>> np.isclose(_reduced_chisq(profile, model, 2., 2), 0.625)
+    True
+    """
+    if not HAS_NUMBA:
+        return np.sum((profile - model) ** 2 / profile_err ** 2) / ndof
+    profile = np.asarray(profile, dtype=np.float64)
+    # The error can also be a scalar
+    profile_err = np.broadcast_to(
+        np.asarray(profile_err, dtype=np.float64), profile.shape
+    )
+    return _reduced_chisq_numba(
+        profile, np.asarray(model, dtype=np.float64), profile_err, ndof
+    )
+
+
+def _refine_sinusoid_fit(guess_pars, basis, profile, profile_err):
+    """Refine the fit with leastsq, starting from ``guess_pars``."""
+    from scipy import optimize
+
+    startidx = len(guess_pars) % 2
+    fit_pars, success = optimize.leastsq(
+        _dbl_cos_residuals,
+        guess_pars[:],
+        args=(basis, profile),
+        Dfun=_dbl_cos_jacobian,
+    )
+    _adjust_amp_phase_inplace(fit_pars, startidx)
+    _adjust_amp_phase_inplace(fit_pars, startidx + 2)
+    model = _dbl_cos_fit_func_from_basis(fit_pars, basis)
+    chisq = _reduced_chisq(
+        profile, model, profile_err, len(profile) - (startidx + 4)
+    )
+    return fit_pars, success, chisq
+
+
 def fit_profile_with_sinusoids(
     profile, profile_err, debug=False, nperiods=1, baseline=False
 ):
     """
     Fit a folded profile with the std_fold_fit_func.
 
-    Tries a number of different initial values for the fit, and returns the
+    The model is linear in the sine and cosine amplitudes of each harmonic,
+    so the initial values of the fit are the closed-form least-squares
+    solution, obtained from the FFT of the profile when possible. If the
+    refinement fails, tries a few different initial phases, and returns the
     result of the best chi^2 fit
 
     Parameters
@@ -397,54 +628,51 @@ def fit_profile_with_sinusoids(
         the best chi^2
     """
     x = np.arange(0, len(profile) * nperiods, nperiods) / float(len(profile))
-    guess_pars = [
-        max(profile) - np.mean(profile),
-        x[np.argmax(profile[: len(profile) // nperiods])],
-        0,
-        0.25,
-    ]
+    basis = _profile_basis(len(profile), nperiods)
     startidx = 0
     if baseline:
-        guess_pars = [np.mean(profile)] + guess_pars
-        if debug:
-            log.debug(guess_pars)
         startidx = 1
-    chisq_save = 1e32
-    fit_pars_save = guess_pars
-    success_save = -1
+
+    if 4 * nperiods < len(profile):
+        guess_pars = _dbl_cos_fft_fit(
+            profile, nperiods=nperiods, baseline=baseline
+        )
+    else:
+        guess_pars = _dbl_cos_linear_fit(profile, basis, baseline=baseline)
+    guess_pars = np.asarray(guess_pars)
     if debug:
         import matplotlib.pyplot as plt
 
+        log.debug(guess_pars)
         fig = plt.figure("Debug profile")
         plt.title("Debug profile")
         plt.errorbar(x, profile, yerr=profile_err, drawstyle="steps-mid")
         plt.plot(x, std_fold_fit_func(guess_pars, x), "r--")
 
-    for phase in np.arange(0.0, 1.0, 0.1):
-        guess_pars[3 + startidx] = phase
-        if debug:
-            log.debug(guess_pars)
-            plt.plot(x, std_fold_fit_func(guess_pars, x), "r--")
-        fit_pars, success = optimize.leastsq(
-            std_residuals, guess_pars[:], args=(x, profile)
-        )
-        if debug:
-            plt.plot(x, std_fold_fit_func(fit_pars, x), "g--")
-        fit_pars[startidx : startidx + 2] = adjust_amp_phase(
-            fit_pars[startidx : startidx + 2]
-        )
-        fit_pars[startidx + 2 : startidx + 4] = adjust_amp_phase(
-            fit_pars[startidx + 2 : startidx + 4]
-        )
-        chisq = np.sum(
-            (profile - std_fold_fit_func(fit_pars, x)) ** 2 / profile_err ** 2
-        ) / (len(profile) - (startidx + 4))
-        if debug:
-            plt.plot(x, std_fold_fit_func(fit_pars, x), "b--")
-        if chisq < chisq_save:
-            chisq_save = chisq
-            fit_pars_save = fit_pars[:]
-            success_save = success
+    fit_pars_save, success_save, chisq_save = _refine_sinusoid_fit(
+        guess_pars, basis, profile, profile_err
+    )
+    if debug:
+        plt.plot(x, std_fold_fit_func(fit_pars_save, x), "b--")
+
+    if success_save not in [1, 2, 3, 4]:
+        # Safeguard: try again from a few initial phases of the harmonic
+        # One fit after the other: leastsq holds the GIL while it calls the
+        # Python residual function, so a thread pool would not help
+        for phase in np.arange(0.0, 1.0, 0.25):
+            guess_pars[3 + startidx] = phase
+            if debug:
+                log.debug(guess_pars)
+                plt.plot(x, std_fold_fit_func(guess_pars, x), "r--")
+            fit_pars, success, chisq = _refine_sinusoid_fit(
+                guess_pars, basis, profile, profile_err
+            )
+            if debug:
+                plt.plot(x, std_fold_fit_func(fit_pars, x), "b--")
+            if chisq < chisq_save:
+                chisq_save = chisq
+                fit_pars_save = fit_pars[:]
+                success_save = success
 
     if debug:
         plt.savefig("debug_fit_profile.png")
@@ -474,7 +702,7 @@ def get_energy_from_events(ev):
         elabel = "PI"
         ev.energy = energy
     else:
-        energy = np.ones_like(ev.time)
+        energy = None
         elabel = ""
     return elabel, energy
 
@@ -549,12 +777,212 @@ def filter_energy(ev: EventList, emin: float, emax: float) -> (EventList, str):
     if emax is None:
         emax = np.max(energy)
 
-    good = (energy >= emin) & (energy <= emax)
-    ev.time = times[good]
-    ev.energy = energy[good]
+    # Build the mask in place, and find the indices of good events only once
+    # for both arrays
+    good = energy >= emin
+    np.logical_and(good, energy <= emax, out=good)
+    good = np.flatnonzero(good)
+    ev.time = times.take(good)
+    ev.energy = energy.take(good)
     return ev, elabel
 
 
+def _pulse_phase_horner(times, freq, fdot=0, fddot=0):
+    """Pulse phase between 0 and 1, as ``pulse_phase(..., to_1=True)``.
+
+    The polynomial is evaluated in Horner form, in place on a single array.
+
+    Examples
+    --------
+    >>> from stingray.pulse.pulsar import pulse_phase
+    >>> times = np.array([0.25, 1.5, 2.75])
+    >>> ph = _pulse_phase_horner(times, 1, 0.1, 0.01)
+    >>> np.allclose(ph, pulse_phase(times, 1, 0.1, 0.01, to_1=True))
+    True
+    >>> np.allclose(_pulse_phase_horner(times, 1), [0.25, 0.5, 0.75])
+    True
+    """
+    if fdot == 0 and fddot == 0:
+        phases = times * freq
+    else:
+        phases = times * (fddot / 6)
+        phases += fdot / 2
+        phases *= times
+        phases += freq
+        phases *= times
+    np.mod(phases, 1, out=phases)
+    return phases
+
+
+def _quantile_edges(a, nq):
+    """Edges of ``nq`` bins containing the same number of elements of ``a``.
+
+    Same result as ``np.percentile(a, np.linspace(0, 100, nq + 1))``, but
+    only the elements needed for the linear interpolation are put in place
+    with ``np.partition``.
+
+    Examples
+    --------
+    >>> a = np.random.uniform(0, 10, 1001)
+    >>> edges = _quantile_edges(a, 16)
+    >>> np.allclose(edges, np.percentile(a, np.linspace(0, 100, 17)))
+    True
+    """
+    pos = np.linspace(0, a.size - 1, nq + 1)
+    low = np.floor(pos).astype(np.intp)
+    high = np.minimum(low + 1, a.size - 1)
+    part = np.partition(a, np.unique(np.concatenate((low, high))))
+    return part[low] + (part[high] - part[low]) * (pos - low)
+
+
+@njit(nogil=True, cache=True)
+def _phase_bin(t, freq, fdot, fddot, nbin):
+    ph = t * freq + t * t * fdot / 2 + t * t * t * fddot / 6
+    ph -= np.floor(ph)
+    return min(int(ph * nbin), nbin - 1)
+
+
+@njit(nogil=True, parallel=True, cache=True)
+def _fold_histogram_numba(times, freq, fdot, fddot, nbin, nchunks):
+    n = times.size
+    chunk_size = n // nchunks + 1
+    local_profiles = np.zeros((nchunks, nbin))
+    for c in prange(nchunks):
+        for i in range(c * chunk_size, min((c + 1) * chunk_size, n)):
+            ph_bin = _phase_bin(times[i], freq, fdot, fddot, nbin)
+            local_profiles[c, ph_bin] += 1
+
+    profile = np.zeros(nbin)
+    for c in range(nchunks):
+        profile += local_profiles[c]
+    return profile
+
+
+@njit(nogil=True, parallel=True, cache=True)
+def _fold_histogram_2d_numba(
+    times, energy_bin, freq, fdot, fddot, nbin, nebin, nchunks
+):
+    n = times.size
+    chunk_size = n // nchunks + 1
+    local_hists = np.zeros((nchunks, nbin, nebin))
+    for c in prange(nchunks):
+        for i in range(c * chunk_size, min((c + 1) * chunk_size, n)):
+            ph_bin = _phase_bin(times[i], freq, fdot, fddot, nbin)
+            local_hists[c, ph_bin, energy_bin[i]] += 1
+
+    hist2d = np.zeros((nbin, nebin))
+    for c in range(nchunks):
+        hist2d += local_hists[c]
+    return hist2d
+
+
+def fold_and_histogram(
+    times,
+    freq,
+    fdot=0,
+    fddot=0,
+    nbin=16,
+    energy_bin=None,
+    nebin=16,
+    precision="float32",
+):
+    """Fold events and histogram them in phase and, optionally, energy.
+
+    When Numba is available, the pulse phase of each event is calculated and
+    binned in a single pass, without storing the phases.
+
+    Parameters
+    ----------
+    times : array of floats
+        Event times, relative to the reference time of the timing solution
+    freq : float
+        Pulse frequency
+
+    Other parameters
+    ----------------
+    fdot : float
+        First frequency derivative
+    fddot : float
+        Second frequency derivative
+    nbin : int
+        Number of phase bins
+    energy_bin : array of ints, default None
+        Index of the energy bin of each event. If None, only the pulse
+        profile is calculated
+    nebin : int
+        Number of energy bins
+    precision : str, default "float32"
+        Data type of the pulse phases passed to the histogram (only used
+        without Numba). Phases are always calculated in double precision;
+        being between 0 and 1, single precision is enough to bin them.
+        Use "float64" to keep double precision throughout
+
+    Returns
+    -------
+    profile : array of floats
+        The pulse profile
+    hist2d : array of floats
+        The phase-energy histogram, with shape ``(nbin, nebin)``. None if
+        ``energy_bin`` is None
+
+    Examples
+    --------
+    >>> times = np.arange(0, 1, 0.1) + 0.05
+    >>> profile, hist2d = fold_and_histogram(times, 1, nbin=5)
+    >>> np.allclose(profile, 2)
+    True
+    >>> hist2d is None
+    True
+    >>> energy_bin = np.array([0, 1] * 5)
+    >>> profile, hist2d = fold_and_histogram(
+    ...     times, 1, nbin=5, energy_bin=energy_bin, nebin=2)
+    >>> np.allclose(profile, 2)
+    True
+    >>> np.allclose(hist2d, 1)
+    True
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if HAS_NUMBA:
+        nchunks = max(min(os.cpu_count() or 1, times.size // 10000), 1)
+        if energy_bin is None:
+            profile = _fold_histogram_numba(
+                times, freq, fdot, fddot, nbin, nchunks
+            )
+            return profile, None
+        hist2d = _fold_histogram_2d_numba(
+            times,
+            np.asarray(energy_bin, dtype=np.int64),
+            freq,
+            fdot,
+            fddot,
+            nbin,
+            nebin,
+            nchunks,
+        )
+        return hist2d.sum(axis=1), hist2d
+
+    phases = _pulse_phase_horner(times, freq, fdot, fddot)
+    phases = phases.astype(precision, copy=False)
+    # Rounding might bring the phases to 1. Keep them in the last bin
+    np.minimum(
+        phases,
+        np.nextafter(phases.dtype.type(1), phases.dtype.type(0)),
+        out=phases,
+    )
+    # Phase bins are uniform: find the bin index by direct arithmetic, then
+    # count the events in each (phase, energy) bin with bincount
+    phase_bin = (phases * nbin).astype(np.intp)
+    if energy_bin is None:
+        profile = np.bincount(phase_bin, minlength=nbin).astype(np.float64)
+        return profile, None
+
+    phase_bin *= nebin
+    phase_bin += energy_bin
+    hist2d = np.bincount(phase_bin, minlength=nbin * nebin)
+    hist2d = hist2d.reshape(nbin, nebin).astype(np.float64)
+    return hist2d.sum(axis=1), hist2d
+
+
 def run_folding(
     file,
     freq,
@@ -570,27 +998,35 @@ def run_folding(
     smooth_window=None,
     deorbit_par=None,
     pepoch=None,
+    precision="float32",
     **opts,
 ):
-    from matplotlib.gridspec import GridSpec
-    import matplotlib.pyplot as plt
+    from scipy.signal import savgol_coeffs
+    from scipy.ndimage import convolve1d
+    from astropy.stats import poisson_conf_interval
 
     file_label = ""
     ev = load_events(file)
     if deorbit_par is not None:
         ev = deorbit_events(ev, deorbit_par)
 
-    plot_energy = True
     ev, elabel = filter_energy(ev, emin, emax)
-    times, energy = ev.time, ev.energy
-    if emin is None:
+    # Without energy information, skip everything energy-related
+    plot_energy = elabel != ""
+    times = ev.time
+    energy = ev.energy if plot_energy else None
+    if ev.gti is not None and len(ev.gti) > 0:
+        # Only fold events inside GTIs. dt=0 because these are events, not
+        # bins of a light curve
+        good = np.flatnonzero(create_gti_mask(times, ev.gti, dt=0))
+        times = times.take(good)
+        if plot_energy:
+            energy = energy.take(good)
+    if plot_energy and emin is None:
         emin = np.min(energy)
-    if emax is None:
+    if plot_energy and emax is None:
         emax = np.max(energy)
 
-    if elabel == "":
-        plot_energy = False
-
     if tref is not None and pepoch is not None:
         raise ValueError("Only specify one between tref and pepoch")
     elif pepoch is not None:
@@ -598,61 +1034,87 @@ def run_folding(
     elif tref is None:
         tref = times[0]
 
-    phases = pulse_phase(times - tref, freq, fdot, fddot, to_1=True)
-
     binx = np.linspace(0, 1, nbin + 1)
+    energy_bin = None
     if plot_energy:
-        biny = np.percentile(energy, np.linspace(0, 100, nebin + 1))
+        biny = _quantile_edges(energy, nebin)
         biny[0] = emin
         biny[-1] = emax
+        # The energy bins are not uniform. Find the energy bin of each event
+        # only once, so that the 2D histogram can be calculated on a uniform
+        # grid. Events at the upper edge go in the last bin, as in numpy.
+        energy_bin = np.searchsorted(biny, energy, side="right") - 1
+        energy_bin = np.minimum(energy_bin, nebin - 1)
+        histen = np.bincount(energy_bin, minlength=nebin)
+
+    profile, hist2d = fold_and_histogram(
+        times - tref,
+        freq,
+        fdot,
+        fddot,
+        nbin=nbin,
+        energy_bin=energy_bin,
+        nebin=nebin,
+        precision=precision,
+    )
 
-    profile, _ = np.histogram(phases, bins=binx)
     if smooth_window is None:
         smooth_window = np.min([len(profile), 10])
         smooth_window = _check_odd(smooth_window)
 
-    smoothed_profile = savgol_filter(
-        profile, window_length=smooth_window, polyorder=3, mode="wrap"
-    )
+    # Savitzky-Golay smoothing, as savgol_filter(..., mode="wrap"). The
+    # coefficients are calculated once, for the profile and all energies
+    savgol_kernel = savgol_coeffs(smooth_window, polyorder=3)
+    smoothed_profile = convolve1d(profile, savgol_kernel, mode="wrap")
 
     profile = np.concatenate((profile, profile))
     smooth = np.concatenate((smoothed_profile, smoothed_profile))
 
-    if plot_energy:
-        histen, _ = np.histogram(energy, bins=biny)
-
-        hist2d, _, _ = np.histogram2d(
-            phases.astype(np.float64), energy, bins=(binx, biny)
-        )
-
+    # The 2D histogram is kept on a single period, and is only displayed
+    # twice (see below), so that it is never copied just for the plot
+    binx_single = binx
     binx = np.concatenate((binx[:-1], binx + 1))
     meanbins = (binx[:-1] + binx[1:]) / 2
 
     if plot_energy:
-        hist2d = np.vstack((hist2d, hist2d))
-        hist2d_save = np.copy(hist2d)
-        X, Y = np.meshgrid(binx, biny)
+        # Keep the counts for the energy-resolved profiles, and write the
+        # normalized histogram to a single new buffer
+        hist2d_save = hist2d
+        hist2d = np.empty_like(hist2d_save)
 
         if norm == "ratios":
-            hist2d /= smooth[:, np.newaxis]
-            hist2d *= histen[np.newaxis, :]
+            np.divide(
+                hist2d_save, smoothed_profile[:, np.newaxis], out=hist2d
+            )
+            np.multiply(hist2d, histen[np.newaxis, :], out=hist2d)
             file_label = "_ratios"
         else:
-            hist2d /= histen[np.newaxis, :]
-            factor = np.max(hist2d, axis=0)[np.newaxis, :]
-            hist2d /= factor
+            np.divide(hist2d_save, histen[np.newaxis, :], out=hist2d)
+            factor = np.max(hist2d, axis=0)
+            np.divide(hist2d, factor[np.newaxis, :], out=hist2d)
             file_label = "_to1"
 
-    plt.figure(figsize=(8, 8))
+    from matplotlib.gridspec import GridSpec
+
+    if test:
+        # Only save the figure: no need for pyplot and an interactive backend
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(8, 8))
+    else:  # pragma:no cover
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=(8, 8))
+
     if plot_energy:
-        gs = GridSpec(2, 2, height_ratios=(1.5, 3))
-        ax0 = plt.subplot(gs[0, 0])
-        ax1 = plt.subplot(gs[1, 0], sharex=ax0)
-        ax2 = plt.subplot(gs[1, 1], sharex=ax0)
-        ax3 = plt.subplot(gs[0, 1])
+        gs = GridSpec(2, 2, figure=fig, height_ratios=(1.5, 3))
+        ax0 = fig.add_subplot(gs[0, 0])
+        ax1 = fig.add_subplot(gs[1, 0], sharex=ax0)
+        ax2 = fig.add_subplot(gs[1, 1], sharex=ax0)
+        ax3 = fig.add_subplot(gs[0, 1])
 
     else:
-        ax0 = plt.subplot()
+        ax0 = fig.add_subplot()
 
     # Plot pulse profile
     max = np.max(smooth)
@@ -708,41 +1170,48 @@ def run_folding(
     ax0.set_xlabel("Phase")
 
     if plot_energy:
-        ax1.pcolormesh(X, Y, hist2d.T, cmap="Greys_r")
+        # Empty energy bins (e.g. from repeated quantile edges with integer
+        # PI values) are NaN in the "to1" normalization. Ignore them
+        vmin, vmax = np.nanmin(hist2d), np.nanmax(hist2d)
+        for period_start in [0, 1]:
+            ax1.pcolormesh(
+                binx_single + period_start,
+                biny,
+                hist2d.T,
+                cmap="Greys_r",
+                vmin=vmin,
+                vmax=vmax,
+            )
         ax1.semilogy()
 
         ax1.set_xlabel("Phase")
         ax1.set_ylabel(elabel)
         ax1.set_xlim([0, 2])
 
-        pfs = []
-        errs = []
         meannrgs = (biny[:-1] + biny[1:]) / 2
-        for i, prof in enumerate(hist2d_save.T):
-            smooth = savgol_filter(
-                prof, window_length=smooth_window, polyorder=3, mode="wrap"
-            )
-            mean = np.mean(smooth)
-            shift = 3 * np.sqrt(mean)
-            max = np.max(smooth)
-            min = np.min(smooth)
-            pf = 100 * (max - min) / max
+        # Smooth the profiles at all energies at once
+        smooth_all = convolve1d(
+            hist2d_save, savgol_kernel, axis=0, mode="wrap"
+        )
+        means = np.mean(smooth_all, axis=0)
+        shift = 3 * np.sqrt(means)
+        maxs = np.max(smooth_all, axis=0)
+        mins = np.min(smooth_all, axis=0)
+        pfs = 100 * (maxs - mins) / maxs
+        errs = 100 * np.std(hist2d_save - smooth_all, axis=0) / maxs
+        for i in range(nebin):
             ax2.plot(
                 meanbins,
-                prof - mean + i * shift,
+                np.tile(hist2d_save[:, i], 2) - means[i] + i * shift[i],
                 drawstyle="steps-mid",
                 alpha=0.5,
                 color="k",
             )
             ax2.plot(
                 meanbins,
-                smooth - mean + i * shift,
+                np.tile(smooth_all[:, i], 2) - means[i] + i * shift[i],
                 label="{}={:.2f}-{:.2f}".format(elabel, biny[i], biny[i + 1]),
             )
-            std = np.std(prof - smooth)
-
-            pfs.append(pf)
-            errs.append(100 * std / max)
         ax2.set_xlabel("Phase")
         ax2.set_ylabel("Counts (shifted arbitrarily)")
 
@@ -759,8 +1228,8 @@ def run_folding(
         ax3.set_xlabel("Energy")
         ax3.set_ylabel("Pulsed fraction")
 
-    plt.tight_layout()
-    plt.savefig("Energyprofile" + file_label + ".png")
+    fig.tight_layout()
+    fig.savefig("Energyprofile" + file_label + ".png")
     if not test:  # pragma:no cover
         plt.show()
 
@@ -11,6 +11,7 @@ from collections.abc import Iterable
 import importlib
 import warnings
 import pickle
+import hashlib
 import os.path
 import numpy as np
 
@@ -51,6 +52,10 @@ if HAS_C256:
         [(str("real"), np.longdouble), (str("imag"), np.longdouble)]
     )
 
+# High precision numbers are saved in netCDF files as separate variables,
+# with these suffixes
+HIGH_PREC_SUFFIXES = ["_I", "_L", "_F", "_k"]
+
 
 class EFPeriodogram(object):
     def __init__(
@@ -301,11 +306,16 @@ def save_as_netcdf(vars, varnames, formats, fname):
     rootgrp.close()
 
 
-def read_from_netcdf(fname):
-    """Read from a netCDF4 file."""
+def read_from_netcdf(fname, keys=None):
+    """Read from a netCDF4 file.
+
+    If ``keys`` is specified, only read the variables with those names.
+    """
     rootgrp = nc.Dataset(fname)
     out = {}
     for k in rootgrp.variables.keys():
+        if keys is not None and k not in keys:
+            continue
         dum = rootgrp.variables[k]
         values = dum.__array__()
         # Handle special case of complex
@@ -417,6 +427,22 @@ def save_events(eventlist, fname):
         _save_data_nc(out, fname)
 
 
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "hendrics")
+
+
+def _cache_file_root(fname, prefix, cache_dir=None):
+    """Root name of the cache files of ``fname``.
+
+    The name depends on the path, modification time and size of the file,
+    so that the cache is invalidated when the file changes.
+    """
+    cache_dir = assign_value_if_none(cache_dir, DEFAULT_CACHE_DIR)
+    stat = os.stat(fname)
+    key = f"{os.path.abspath(fname)}:{stat.st_mtime_ns}:{stat.st_size}"
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(cache_dir, f"{prefix}_{digest}")
+
+
 def load_events(fname):
     """Load events from a file."""
     if get_file_format(fname) == "pickle":
@@ -447,6 +473,67 @@ def load_events(fname):
     return eventlist
 
 
+def _cached_load_events(fname, cache_dir=None):
+    """Load an event list, using an on-disk cache.
+
+    The event arrays are saved as ``.npy`` files, and memory-mapped
+    when loaded again. The other attributes are pickled.
+
+    Parameters
+    ----------
+    fname : str
+        The file name of the event list
+
+    Other parameters
+    ----------------
+    cache_dir : str, default None
+        Directory of the cache. Default ``~/.cache/hendrics``
+    """
+    from .base import mkdir_p
+
+    cache_dir = assign_value_if_none(cache_dir, DEFAULT_CACHE_DIR)
+    root = _cache_file_root(fname, "events", cache_dir)
+    # Written last: if it exists, the arrays are complete
+    meta_file = root + ".meta.pkl"
+
+    if os.path.exists(meta_file):
+        try:
+            with open(meta_file, "rb") as fobj:
+                arrays, attrs = pickle.load(fobj)
+            events = EventList()
+            for attr, value in attrs.items():
+                setattr(events, attr, value)
+            for attr in arrays:
+                data = np.load(f"{root}.{attr}.npy", mmap_mode="r")
+                setattr(events, attr, data)
+            return events
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            log.warning(f"Invalid cache files {root}*. Ignoring")
+
+    events = load_events(fname)
+    arrays = [
+        attr
+        for attr in ["time", "energy", "pi", "cal_pi"]
+        if getattr(events, attr, None) is not None
+    ]
+    attrs = {
+        attr: value
+        for attr, value in events.__dict__.items()
+        if attr not in arrays
+    }
+    try:
+        mkdir_p(cache_dir)
+        for attr in arrays:
+            np.save(f"{root}.{attr}.npy", getattr(events, attr))
+        with open(meta_file, "wb") as fobj:
+            pickle.dump(
+                (arrays, attrs), fobj, protocol=pickle.HIGHEST_PROTOCOL
+            )
+    except (OSError, pickle.PicklingError):
+        log.warning(f"Could not cache {fname} in {cache_dir}")
+    return events
+
+
 # ----- functions to save and load LCURVE data
 def save_lcurve(lcurve, fname, lctype="Lightcurve"):
     """Save Light curve to file
@@ -571,6 +658,63 @@ def save_folding(efperiodogram, fname):
         return _save_data_nc(outdata, fname)
 
 
+def load_folding_peak_only(fname, use_cache=False, cache_dir=None):
+    """Load only the first peak frequency of a folding search output.
+
+    Contrary to `load_folding`, the other contents are not read from
+    netCDF files. Pickle files can only be read in full: optionally, their
+    peak is cached on disk, and the file is not read again until it changes.
+
+    Parameters
+    ----------
+    fname : str
+        The file name of the folding search output
+
+    Other parameters
+    ----------------
+    use_cache : bool, default False
+        Cache the peak of pickle files
+    cache_dir : str, default None
+        Directory of the cache. Default ``~/.cache/hendrics``
+
+    Returns
+    -------
+    peak : float or None
+        The first peak frequency, or None if no peaks were saved
+    """
+    if get_file_format(fname) == "nc":
+        data = _load_data_nc(fname, keys=["peaks"])
+        return _first_peak(data.get("peaks"))
+    if not use_cache:
+        return _first_peak(_load_data_pickle(fname).get("peaks"))
+
+    from .base import mkdir_p
+
+    cache_dir = assign_value_if_none(cache_dir, DEFAULT_CACHE_DIR)
+    cache_file = _cache_file_root(fname, "peak", cache_dir) + ".pkl"
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, "rb") as fobj:
+                return pickle.load(fobj)
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            log.warning(f"Invalid cache file {cache_file}. Ignoring")
+
+    peak = _first_peak(_load_data_pickle(fname).get("peaks"))
+    try:
+        mkdir_p(cache_dir)
+        with open(cache_file, "wb") as fobj:
+            pickle.dump(peak, fobj)
+    except OSError:
+        log.warning(f"Could not write the cache file {cache_file}")
+    return peak
+
+
+def _first_peak(peaks):
+    if peaks is None:
+        return None
+    return np.atleast_1d(peaks)[0]
+
+
 def load_folding(fname):
     """Load PDS from a file."""
     if get_file_format(fname) == "pickle":
@@ -758,9 +902,12 @@ def _save_data_pickle(struct, fname, kind="data"):
     return
 
 
-def _load_data_nc(fname):
+def _load_data_nc(fname, keys=None):
     """Load generic data in netcdf format."""
-    contents = read_from_netcdf(fname)
+    if keys is not None:
+        # Also read the parts of high precision numbers
+        keys = [k + s for k in keys for s in [""] + HIGH_PREC_SUFFIXES]
+    contents = read_from_netcdf(fname, keys=keys)
     keys = list(contents.keys())
 
     keys_to_delete = []
@@ -771,7 +918,7 @@ def _load_data_nc(fname):
         if str(contents[k]) == str("__hen__None__type__"):
             contents[k] = None
 
-        if k[-2:] in ["_I", "_L", "_F", "_k"]:
+        if k[-2:] in HIGH_PREC_SUFFIXES:
             kcorr = k[:-2]
 
             integer_key = kcorr + "_I"
@@ -1,26 +1,26 @@
 """Interactive phaseogram."""
 
-import copy
+import os
 import argparse
 import warnings
+import functools
 from abc import abstractmethod
+from typing import NamedTuple
 
-from scipy.interpolate import interp1d
 import numpy as np
 from astropy import log
 from astropy.logger import AstropyUserWarning
-from astropy.stats import poisson_conf_interval
 from stingray.pulse.search import phaseogram
 from stingray.utils import assign_value_if_none
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider, Button
+from matplotlib.patches import Polygon
 from matplotlib.gridspec import GridSpec
-from scipy.ndimage import gaussian_filter1d
 
-from .fold import filter_energy
-from .io import load_events, load_folding
-from .fold import get_TOAs_from_events
+from .fold import filter_energy, _pulse_phase_horner
+from .io import load_events, _cached_load_events
 from .base import hen_root, deorbit_events
+from .base import njit, prange, HAS_NUMBA
 from .efsearch import h_test
 
 
@@ -40,10 +40,42 @@ def sec_to_mjd(time, mjdref):
     return time / 86400 + mjdref
 
 
+def _interp_extrapolate(x, xp, fp):
+    """Linear interpolation, with linear extrapolation outside ``xp``.
+
+    Equivalent to ``interp1d(xp, fp, fill_value="extrapolate")(x)`` for
+    sorted ``xp``, but based on the much faster ``np.interp``.
+
+    Examples
+    --------
+    >>> xp = np.array([0., 1., 2.])
+    >>> fp = np.array([0., 2., 3.])
+    >>> np.allclose(_interp_extrapolate([-1, 0.5, 1.5, 4], xp, fp),
+    ...             [-2, 1, 2.5, 5])
+    True
+    >>> np.isclose(_interp_extrapolate(0.5, xp, fp), 1)
+    True
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.array(np.interp(x, xp, fp))
+    if len(xp) < 2:
+        return y
+    low = x < xp[0]
+    if np.any(low):
+        slope = (fp[1] - fp[0]) / (xp[1] - xp[0])
+        y[low] = fp[0] + (x[low] - xp[0]) * slope
+    high = x > xp[-1]
+    if np.any(high):
+        slope = (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+        y[high] = fp[-1] + (x[high] - xp[-1]) * slope
+    return y
+
+
 class SliderOnSteroids(Slider):
     def __init__(self, *args, **kwargs):
         self.hardvalmin = None
         self.hardvalmax = None
+        self._callbacks = []
         if "hardvalmin" in kwargs:
             self.hardvalmin = kwargs["hardvalmin"]
             kwargs.pop("hardvalmin")
@@ -51,40 +83,291 @@ class SliderOnSteroids(Slider):
             self.hardvalmax = kwargs["hardvalmax"]
             kwargs.pop("hardvalmax")
         Slider.__init__(self, *args, **kwargs)
+        self._zoom_text_lo = self.ax.text(
+            0,
+            0,
+            "",
+            transform=self.ax.transAxes,
+            horizontalalignment="left",
+            color="white",
+        )
+        self._zoom_text_hi = self.ax.text(
+            1,
+            0,
+            "",
+            transform=self.ax.transAxes,
+            horizontalalignment="right",
+            color="white",
+        )
+
+    def on_changed(self, func):
+        # Remembered, to be connected again if the slider is rebuilt
+        self._callbacks.append(func)
+        return Slider.on_changed(self, func)
+
+    def set_range(self, valmin, valmax):
+        """Change the slider limits, keeping the current value."""
+        val = self.val
+        horizontal = getattr(self, "orientation", "horizontal") == "horizontal"
+        if horizontal and isinstance(self.poly, Polygon):
+            self.valmin, self.valmax, self.valinit = valmin, valmax, val
+            self.ax.set_xlim(valmin, valmax)
+            # Collapse the value patch on the new minimum: set_val then
+            # moves its value side, whatever the vertex layout
+            xy = self.poly.get_xy()
+            xy[:, 0] = valmin
+            self.poly.set_xy(xy)
+            # Also updates the label. No callbacks: the value is the same
+            eventson, self.eventson = self.eventson, False
+            self.set_val(val)
+            self.eventson = eventson
+            self.vline.set_xdata([val, val])
+        else:
+            # Value patch of unknown layout: rebuild the slider
+            callbacks = self._callbacks
+            self.ax.clear()
+            self.__init__(
+                self.ax,
+                self.label.get_text(),
+                valmin=valmin,
+                valmax=valmax,
+                valinit=val,
+                hardvalmin=self.hardvalmin,
+                hardvalmax=self.hardvalmax,
+            )
+            for func in callbacks:
+                self.on_changed(func)
+        self._zoom_text_lo.set_text(format(valmin, ".6g"))
+        self._zoom_text_hi.set_text(format(valmax, ".6g"))
 
 
-def normalized_phaseogram(norm, *args, **kwargs):
-    phas, phases, times, additional_info = phaseogram(*args, **kwargs)
+def _apply_norm(phas, norm):
+    """Normalize each time bin of the phaseogram, in place."""
     if norm is None:
         pass
     elif norm == "to1":
         minarr = np.min(phas, axis=0)
         maxarr = np.max(phas, axis=0)
-        for i in range(phas.shape[0]):
-            phas[i][:] -= minarr
-            phas[i][:] /= maxarr - minarr
+        phas -= minarr[np.newaxis, :]
+        # Empty time bins give NaNs, shown as blank in the plot
+        with np.errstate(invalid="ignore", divide="ignore"):
+            phas /= (maxarr - minarr)[np.newaxis, :]
     elif norm == "mediansub":
         medarr = np.median(phas, axis=0)
-        for i in range(phas.shape[0]):
-            phas[i][:] -= medarr
+        phas -= medarr[np.newaxis, :]
     elif norm == "mediannorm":
         medarr = np.median(phas, axis=0)
-        for i in range(phas.shape[0]):
-            phas[i][:] -= medarr
-        phas[i][:] /= medarr
+        phas -= medarr[np.newaxis, :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            phas /= medarr[np.newaxis, :]
     elif norm == "meansub":
         medarr = np.mean(phas, axis=0)
-        for i in range(phas.shape[0]):
-            phas[i][:] -= medarr
+        phas -= medarr[np.newaxis, :]
     elif norm == "meannorm":
         medarr = np.mean(phas, axis=0)
-        for i in range(phas.shape[0]):
-            phas[i][:] -= medarr
-        phas[i][:] /= medarr
+        phas -= medarr[np.newaxis, :]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            phas /= medarr[np.newaxis, :]
     else:
         warnings.warn(
             "Profile normalization " "{} not known. Using default".format(norm)
         )
+    return phas
+
+
+def _uniform_bin_index(x, xmin, xmax, nbin):
+    """Index of the bin of each element of ``x``, for uniform bins.
+
+    Follows the same algorithm as ``np.histogram`` with uniform bins, so
+    that values close to the bin edges end up in the same bins, but without
+    any binary search. All values are assumed to be between the limits.
+
+    Examples
+    --------
+    >>> x = np.random.uniform(0, 3, 1000)
+    >>> x[:2] = [0, 3]
+    >>> index = _uniform_bin_index(x, 0, 3, 7)
+    >>> np.all(np.bincount(index) == np.histogram(x, bins=7, range=[0, 3])[0])
+    True
+    """
+    edges = np.linspace(xmin, xmax, nbin + 1)
+    index = ((x - xmin) * (nbin / (xmax - xmin))).astype(np.intp)
+    index[index == nbin] -= 1
+    index[x < edges[index]] -= 1
+    index[(x >= edges[index + 1]) & (index != nbin - 1)] += 1
+    return index
+
+
+@njit(nogil=True, cache=True)
+def _uniform_bin_index_scalar(x, edges, norm):
+    """Same as ``_uniform_bin_index``, for a single value."""
+    nbin = edges.size - 1
+    index = min(int((x - edges[0]) * norm), nbin - 1)
+    if x < edges[index]:
+        index -= 1
+    elif index != nbin - 1 and x >= edges[index + 1]:
+        index += 1
+    return max(index, 0)
+
+
+@njit(nogil=True, parallel=True, cache=True)
+def _phaseogram_counts_numba(
+    dt, freq, fdot, fddot, nph, phase_edges, time_edges, nchunks
+):
+    n = dt.size
+    nt = time_edges.size - 1
+    phase_norm = (phase_edges.size - 1) / (phase_edges[-1] - phase_edges[0])
+    time_norm = nt / (time_edges[-1] - time_edges[0])
+    chunk_size = (n + nchunks - 1) // nchunks
+    # One histogram per chunk of events, to avoid race conditions
+    local_counts = np.zeros((nchunks, nph, nt))
+    for c in prange(nchunks):
+        for i in range(c * chunk_size, min((c + 1) * chunk_size, n)):
+            t = dt[i]
+            ph = t * (freq + t * (0.5 * fdot + t * (fddot / 6)))
+            ph -= np.floor(ph)
+            phase_bin = _uniform_bin_index_scalar(ph, phase_edges, phase_norm)
+            phase_bin = min(phase_bin, nph - 1)
+            time_bin = _uniform_bin_index_scalar(t, time_edges, time_norm)
+            local_counts[c, phase_bin, time_bin] += 1
+
+    counts = np.zeros((nph, nt))
+    for c in range(nchunks):
+        counts += local_counts[c]
+    return counts
+
+
+@njit(nogil=True, parallel=True, cache=True)
+def _phaseogram_counts_sorted_numba(
+    dt, freq, fdot, fddot, nph, phase_edges, slice_starts
+):
+    """Histogram of sorted events, processing the time slices in parallel.
+
+    ``slice_starts`` contains the index of the first event of each time
+    slice, followed by the number of events. Each slice only writes its
+    own row of the histogram, so no thread-local copies are needed.
+    """
+    nt = slice_starts.size - 1
+    phase_norm = (phase_edges.size - 1) / (phase_edges[-1] - phase_edges[0])
+    counts = np.zeros((nt, nph))
+    for j in prange(nt):
+        for i in range(slice_starts[j], slice_starts[j + 1]):
+            t = dt[i]
+            ph = t * (freq + t * (0.5 * fdot + t * (fddot / 6)))
+            ph -= np.floor(ph)
+            phase_bin = _uniform_bin_index_scalar(ph, phase_edges, phase_norm)
+            counts[j, min(phase_bin, nph - 1)] += 1
+    return counts.T
+
+
+def _fast_phaseogram(
+    times,
+    f,
+    nph=128,
+    nt=32,
+    fdot=0,
+    fddot=0,
+    pepoch=None,
+    out=None,
+    **kwargs,
+):
+    """Same as stingray's ``phaseogram``, for unweighted events only.
+
+    Phases and times are binned on uniform grids, so that the bin of each
+    event can be found arithmetically and the counts with a single
+    ``np.bincount``, or in a single pass over the events if Numba is
+    installed. With Numba, time-sorted events are processed in parallel
+    over the time slices, found with a binary search. Both periods shown
+    in the phaseogram have the same counts, so the histogram is only
+    calculated once. If ``out`` is given, with shape ``(2 * nph, nt)``,
+    the phaseogram is written there.
+
+    Examples
+    --------
+    >>> times = np.sort(np.random.uniform(0, 100, 1000))
+    >>> phas, phases, tbins, _ = _fast_phaseogram(times, 1.1, nph=8, nt=4)
+    >>> phas_st, phases_st, tbins_st, _ = phaseogram(
+    ...     times, 1.1, nph=8, nt=4)
+    >>> np.all(phas == phas_st)
+    True
+    >>> np.allclose(phases, phases_st) and np.allclose(tbins, tbins_st)
+    True
+    """
+    times = np.asarray(times)
+    if pepoch is None:
+        pepoch = (times[-1] + times[0]) / 2
+    tmin, tmax = np.min(times), np.max(times)
+    phase_edges = np.linspace(0, 2, nph * 2 + 1)
+    time_edges = np.linspace(tmin, tmax, nt + 1)
+
+    if HAS_NUMBA:
+        # Times might be in extended precision: only pass double precision
+        # times relative to pepoch to the kernels
+        dt = (times - pepoch).astype(np.float64)
+        dt_edges = (time_edges - pepoch).astype(np.float64)
+        if np.all(dt[1:] >= dt[:-1]):
+            slice_starts = np.searchsorted(dt, dt_edges)
+            # The last bin includes its right edge
+            slice_starts[-1] = dt.size
+            counts = _phaseogram_counts_sorted_numba(
+                dt,
+                float(f),
+                float(fdot),
+                float(fddot),
+                nph,
+                phase_edges,
+                slice_starts,
+            )
+        else:
+            nchunks = max(min(os.cpu_count() or 1, dt.size // 10000), 1)
+            counts = _phaseogram_counts_numba(
+                dt,
+                float(f),
+                float(fdot),
+                float(fddot),
+                nph,
+                phase_edges,
+                dt_edges,
+                nchunks,
+            )
+    else:
+        # times - pepoch is a new array: evaluate the phases in place on it
+        phases = _pulse_phase_horner(times - pepoch, f, fdot, fddot)
+
+        # The phase bins are those of the full phaseogram, over two periods
+        phase_bin = _uniform_bin_index(phases, 0, 2, 2 * nph)
+        # Rounding might bring a phase to 1
+        np.minimum(phase_bin, nph - 1, out=phase_bin)
+        time_bin = _uniform_bin_index(times, tmin, tmax, nt)
+
+        phase_bin *= nt
+        phase_bin += time_bin
+        counts = np.bincount(phase_bin, minlength=nph * nt)
+        counts = counts.reshape(nph, nt)
+
+    phas = out if out is not None else np.empty((2 * nph, nt))
+    phas[:nph] = counts
+    phas[nph:] = counts
+    return phas, phase_edges, time_edges, {}
+
+
+def normalized_phaseogram(norm, *args, out=None, **kwargs):
+    if (
+        kwargs.get("plot", False)
+        or kwargs.get("weights") is not None
+        or kwargs.get("mjdref") is not None
+        or kwargs.get("ph0", 0) != 0
+    ):
+        phas, phases, times, additional_info = phaseogram(*args, **kwargs)
+        if out is not None:
+            out[:] = phas
+            phas = out
+    else:
+        phas, phases, times, additional_info = _fast_phaseogram(
+            *args, out=out, **kwargs
+        )
+    # Only used for display: single precision is more than enough
+    phas = _apply_norm(phas.astype(np.float32, copy=False), norm)
     return phas, phases, times, additional_info
 
 
@@ -164,21 +447,23 @@ class BasePhaseogram(object):
         self.position = position
         self.object = object
         self.timing_model_string = ""
+        self._tm_string_cache = None
 
-        self.time_corr_fun = interp1d(
-            self.ev_times,
-            self.time_corr,
-            bounds_error=False,
-            fill_value="extrapolate",
+        self._ev_mjd = self.ev_times / 86400 + mjdref
+        self._time_corr_days = self.time_corr / 86400
+        self.time_corr_fun = functools.partial(
+            _interp_extrapolate, xp=self.ev_times, fp=self.time_corr
         )
-        self.time_corr_mjd_fun = interp1d(
-            self.ev_times / 86400 + mjdref,
-            self.time_corr / 86400,
-            bounds_error=False,
-            fill_value="extrapolate",
+        self.time_corr_mjd_fun = functools.partial(
+            _interp_extrapolate, xp=self._ev_mjd, fp=self._time_corr_days
         )
 
         self.fig = plt.figure(label, figsize=(6, 8))
+        # On slider moves, only redraw what changes, over a cached background
+        self._use_blit = not plot_only and getattr(
+            self.fig.canvas, "supports_blit", False
+        )
+        self._background = None
         gs = GridSpec(3, 1, height_ratios=[2, 3, 0.2])
         plt.subplots_adjust(left=0.1, bottom=0.30, top=0.95, right=0.95)
         ax = plt.subplot(gs[1])
@@ -187,12 +472,10 @@ class BasePhaseogram(object):
         colorbax = plt.subplot(gs[2])
 
         corrected_times = self.ev_times - self._delay_fun(self.ev_times)
-        (
-            self.unnorm_phaseogr,
-            phases,
-            times,
-            additional_info,
-        ) = normalized_phaseogram(
+        # Stored as (time, phase), the orientation of the image, so that
+        # the phaseogram is never transposed when drawing
+        self.unnorm_phaseogr = np.empty((nt, 2 * nph), dtype=np.float32)
+        _, phases, times, additional_info = normalized_phaseogram(
             None,
             corrected_times,
             freq,
@@ -203,29 +486,33 @@ class BasePhaseogram(object):
             fddot=fddot,
             plot=False,
             pepoch=pepoch,
+            out=self.unnorm_phaseogr.T,
         )
 
-        self.phaseogr, phases, times, additional_info = normalized_phaseogram(
-            self.norm,
-            corrected_times,
-            freq,
-            return_plot=True,
-            nph=nph,
-            nt=nt,
-            fdot=fdot,
-            fddot=fddot,
-            plot=False,
-            pepoch=pepoch,
-        )
+        # Both phaseograms are then updated in place on every refold
+        self.phaseogr = None
+        self._normalize()
 
         self.phases, self.times = phases, times
+        # The time bins never change between refolds
+        self._tseg = float(np.median(np.diff(self.times)))
+        self._tobs = self._tseg * self.nt
+        self._cache_line_delay()
         vmin = None
         if self.norm is not None and (
             "sub" in self.norm or "to1" in self.norm
         ):
             vmin = 0
-        self.pcolor = ax.pcolormesh(
-            phases, times, self.phaseogr.T, cmap=DEFAULT_COLORMAP, vmin=vmin
+        # Phase and time bins are uniform: a single image is much faster to
+        # draw (and redraw) than a mesh
+        self.pcolor = ax.imshow(
+            self.phaseogr,
+            aspect="auto",
+            origin="lower",
+            extent=[phases[0], phases[-1], times[0], times[-1]],
+            cmap=DEFAULT_COLORMAP,
+            interpolation="nearest",
+            vmin=vmin,
         )
         self.colorbar = plt.colorbar(
             self.pcolor, cax=colorbax, orientation="horizontal"
@@ -251,7 +538,12 @@ class BasePhaseogram(object):
         self.line_phases = np.arange(-2, 3, 0.5)
         for ph0 in self.line_phases:
             (newline,) = ax.plot(
-                np.zeros_like(times) + ph0, times, zorder=10, lw=2, color="w"
+                np.zeros_like(times) + ph0,
+                times,
+                zorder=10,
+                lw=2,
+                color="w",
+                animated=self._use_blit,
             )
             self.lines.append(newline)
 
@@ -279,6 +571,8 @@ class BasePhaseogram(object):
         )
 
         self._construct_widgets(**kwargs)
+        self._setup_blit()
+        self.fig.canvas.mpl_connect("draw_event", self._on_draw)
 
         self.closeax = plt.axes([0.15, 0.020, 0.15, 0.04])
         self.button_close = Button(
@@ -318,15 +612,16 @@ class BasePhaseogram(object):
         self.button_close.on_clicked(self.quit)
         # self.profax = plt.axes([0.25, 0.75, 0.5, 0.2])
 
-        prof = np.sum(np.nan_to_num(self.unnorm_phaseogr), axis=1)
-        nbin = len(prof)
-        phas = np.linspace(0, 2, nbin + 1)[:-1]
+        self._cache_profile()
+        prof, phas = self._prof, self._prof_phases
         (self.profile_fixed,) = self.profax.plot(
             phas, prof, drawstyle="steps-post", color="grey"
         )
         (self.profile,) = self.profax.plot(
             phas, prof, drawstyle="steps-post", color="k"
         )
+        from astropy.stats import poisson_conf_interval
+
         mean = np.mean(prof)
         low, high = poisson_conf_interval(
             mean, interval="frequentist-confidence", sigma=2
@@ -360,97 +655,104 @@ class BasePhaseogram(object):
             AstropyUserWarning,
         )
 
+    def _animated_artists(self):
+        """Artists that change on every slider move."""
+        artists = list(self.lines)
+        for s in self.sliders:
+            artists += [
+                getattr(s, name)
+                for name in ["poly", "valtext", "_handle"]
+                if hasattr(s, name)
+            ]
+        return artists
+
+    def _setup_blit(self):
+        """Leave the artists changed by the sliders out of full redraws."""
+        if not self._use_blit:
+            return
+        for s in self.sliders:
+            s.drawon = False
+        for artist in self._animated_artists():
+            artist.set_animated(True)
+
+    def _on_draw(self, event):
+        """Cache the background after a full redraw, and complete it."""
+        # When saving, matplotlib draws animated artists itself
+        if not self._use_blit or self.fig.canvas.is_saving():
+            return
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self._animated_artists():
+            self.fig.draw_artist(artist)
+
+    def _redraw_animated(self):
+        """Redraw only the lines and the sliders, over the background."""
+        if self._background is None:
+            self.fig.canvas.draw_idle()
+            return
+        self.fig.canvas.restore_region(self._background)
+        for artist in self._animated_artists():
+            self.fig.draw_artist(artist)
+        self.fig.canvas.blit(self.fig.bbox)
+
+    @property
+    def _dirty(self):
+        """Whether the sliders differ from the parameters of the last fold.
+
+        If not, recalculate can skip the refold.
+        """
+        return tuple(self._read_sliders()) != tuple(self._folded_values())
+
+    def _print_timing_model(self):
+        self.timing_model_string = self.get_timing_model_string()
+        print("------------------------")
+        print(self.timing_model_string)
+        print("------------------------")
+
     def reset(self, event):
         for s in self.sliders:
             s.reset()
-        self.pcolor.set_array(self.phaseogr.T.ravel())
+        self.pcolor.set_data(self.phaseogr)
         self._set_lines(False)
-        prof = np.sum(np.nan_to_num(self.unnorm_phaseogr), axis=1)
-        ph = np.linspace(0, 2, len(prof) + 1)[:-1]
-        self.profile.set_ydata(prof)
-        self.proftext.set_text(get_H_label(ph, prof))
+        self.profile.set_ydata(self._prof)
+        self.proftext.set_text(get_H_label(self._prof_phases, self._prof))
+        self.fig.canvas.draw_idle()
 
-    def zoom_in(self, event):
+    def _normalize(self):
+        """Normalize the phaseogram, or alias the raw counts if no norm."""
+        if self.norm is None:
+            self.phaseogr = self.unnorm_phaseogr
+            return
+        # Reuse the same buffer on every refold
+        if self.phaseogr is None:
+            self.phaseogr = np.empty_like(self.unnorm_phaseogr)
+        np.copyto(self.phaseogr, self.unnorm_phaseogr)
+        _apply_norm(self.phaseogr.T, self.norm)
+
+    def _cache_profile(self):
+        """Cache the pulse profile of the unnormalized phaseogram."""
+        self._prof = np.nansum(self.unnorm_phaseogr, axis=0, dtype=float)
+        self._prof_phases = np.linspace(0, 2, len(self._prof) + 1)[:-1]
+
+    def _zoom(self, factor):
+        """Rescale the range of all sliders around their current values."""
         for s in self.sliders:
-            valinit = s.val
-            valrange = s.valmax - s.valmin
-            valmin = valinit - valrange / 4
+            valrange = (s.valmax - s.valmin) * factor
+            valmin = s.val - valrange
             if s.hardvalmin is not None:
                 valmin = max(s.hardvalmin, valmin)
-            valmax = valinit + valrange / 4
+            valmax = s.val + valrange
             if s.hardvalmax is not None:
                 valmax = min(s.hardvalmax, valmax)
-            label = s.label.get_text()
-            ax = s.ax
-            ax.clear()
+            s.set_range(valmin, valmax)
+        # Rebuilt sliders have new artists
+        self._setup_blit()
+        self.fig.canvas.draw_idle()
 
-            s.__init__(
-                ax,
-                label,
-                valmin=valmin,
-                valmax=valmax,
-                valinit=valinit,
-                hardvalmax=s.hardvalmax,
-                hardvalmin=s.hardvalmin,
-            )
-            ax.text(
-                0,
-                0,
-                str(valmin),
-                transform=ax.transAxes,
-                horizontalalignment="left",
-                color="white",
-            )
-            ax.text(
-                1,
-                0,
-                str(valmax),
-                transform=ax.transAxes,
-                horizontalalignment="right",
-                color="white",
-            )
-            s.on_changed(self.update)
+    def zoom_in(self, event):
+        self._zoom(1 / 4)
 
     def zoom_out(self, event):
-        for s in self.sliders:
-            valinit = s.val
-            valrange = s.valmax - s.valmin
-            valmin = valinit - valrange
-            if s.hardvalmin is not None:
-                valmin = max(s.hardvalmin, valmin)
-            valmax = valinit + valrange
-            if s.hardvalmax is not None:
-                valmax = min(s.hardvalmax, valmax)
-            label = s.label.get_text()
-            ax = s.ax
-            ax.clear()
-
-            s.__init__(
-                ax,
-                label,
-                valmin=valmin,
-                valmax=valmax,
-                valinit=valinit,
-                hardvalmax=s.hardvalmax,
-                hardvalmin=s.hardvalmin,
-            )
-            ax.text(
-                0,
-                0,
-                str(valmin),
-                transform=ax.transAxes,
-                horizontalalignment="left",
-                color="white",
-            )
-            ax.text(
-                1,
-                0,
-                str(valmax),
-                transform=ax.transAxes,
-                horizontalalignment="right",
-                color="white",
-            )
-            s.on_changed(self.update)
+        self._zoom(1)
 
     @abstractmethod
     def quit(self, event):  # pragma: no cover
@@ -464,6 +766,15 @@ class BasePhaseogram(object):
     def _line_delay_fun(self, times):  # pragma: no cover
         pass
 
+    @abstractmethod
+    def _folded_values(self):  # pragma: no cover
+        """Slider values corresponding to the last fold."""
+        pass
+
+    def _cache_line_delay(self):
+        """Cache what ``_line_delay_fun`` needs at the phaseogram times."""
+        self._dt_lines = (self.times - self.pepoch).astype(np.float64)
+
     @abstractmethod
     def _delay_fun(self, times):  # pragma: no cover
         """This is the delay function _without_ frequency derivatives."""
@@ -475,51 +786,64 @@ class BasePhaseogram(object):
 
     def _set_lines(self, apply_delay=True):
         if apply_delay:
-            func = self._line_delay_fun
+            delay = self._line_delay_fun(self.times)
+            delay = delay - self._line_delay_fun(self.times[0])
         else:
+            delay = np.zeros(len(self.times))
 
-            def func(x):
-                return 0
-
-        for i, ph0 in enumerate(self.line_phases):
-            linephase = ph0 + func(self.times) - func(self.times[0])
-            self.lines[i].set_xdata(linephase)
+        # All lines share the same delay, up to a constant phase
+        all_phases = np.add.outer(self.line_phases, delay)
+        for line, linephase in zip(self.lines, all_phases):
+            line.set_xdata(linephase)
 
     def get_timing_model_string(self):
+        orbital_period = getattr(self, "orbital_period", None)
+        # Only rebuild the string if the timing parameters changed
+        key = (
+            self.freq,
+            self.fdot,
+            self.fddot,
+            self.pepoch,
+            self.mjdref,
+            orbital_period,
+            getattr(self, "asini", None),
+            getattr(self, "t0", None),
+        )
+        if self._tm_string_cache is not None:
+            old_key, tm_string = self._tm_string_cache
+            if old_key == key:
+                return tm_string
 
-        tm_string = ""
-
+        lines = []
         if self.mjdref is not None:
-            tm_string += "PEPOCH         {}\n".format(
-                self.pepoch / 86400 + self.mjdref
+            lines.append(
+                f"PEPOCH         {self.pepoch / 86400 + self.mjdref}"
             )
-        tm_string += "PSRJ           {}\n".format(self.object)
+        lines.append(f"PSRJ           {self.object}")
         if self.position is not None:
-            tm_string += "RAJ            {}\n".format(
-                self.position.ra.to_string("hour", sep=":")
-            )
-            tm_string += "DECJ           {}\n".format(
-                self.position.dec.to_string(sep=":")
-            )
-
-        tm_string += "F0             {}\n".format(self.freq)
-        tm_string += "F1             {}\n".format(self.fdot)
-        tm_string += "F2             {}\n".format(self.fddot)
-
-        if hasattr(self, "orbital_period") and self.orbital_period is not None:
-            tm_string += "BINARY BT\n"
-            tm_string += "PB             {}\n".format(
-                self.orbital_period / 86400
-            )
-            tm_string += "A1             {}\n".format(self.asini)
+            ra = self.position.ra.to_string("hour", sep=":")
+            dec = self.position.dec.to_string(sep=":")
+            lines.append(f"RAJ            {ra}")
+            lines.append(f"DECJ           {dec}")
+
+        lines.append(f"F0             {self.freq}")
+        lines.append(f"F1             {self.fdot}")
+        lines.append(f"F2             {self.fddot}")
+
+        if orbital_period is not None:
+            lines.append("BINARY BT")
+            lines.append(f"PB             {orbital_period / 86400}")
+            lines.append(f"A1             {self.asini}")
             if self.mjdref is not None:
-                tm_string += "T0             {}\n".format(
-                    self.t0 / 86400 + self.mjdref
+                lines.append(
+                    f"T0             {self.t0 / 86400 + self.mjdref}"
                 )
-            tm_string += "T0(MET)        {}\n".format(self.t0)
-            tm_string += "PB(s)          {}\n".format(self.orbital_period)
+            lines.append(f"T0(MET)        {self.t0}")
+            lines.append(f"PB(s)          {orbital_period}")
 
-        tm_string += "PEPOCH(MET)    {}\n".format(self.pepoch)
+        lines.append(f"PEPOCH(MET)    {self.pepoch}")
+        tm_string = "\n".join(lines) + "\n"
+        self._tm_string_cache = (key, tm_string)
         return tm_string
 
 
@@ -529,18 +853,17 @@ class InteractivePhaseogram(BasePhaseogram):
         self.dfdot = 0
         self.dfddot = 0
 
-        tseg = np.median(np.diff(self.times))
-        tobs = tseg * self.nt
+        tobs = self._tobs
         delta_df_start = 4 / tobs
-        self.df_order_of_mag = np.int(np.log10(delta_df_start))
+        self.df_order_of_mag = int(np.floor(np.log10(delta_df_start)))
         delta_df = delta_df_start / 10 ** self.df_order_of_mag
 
         delta_dfdot_start = 8 / tobs ** 2
-        self.dfdot_order_of_mag = np.int(np.log10(delta_dfdot_start))
+        self.dfdot_order_of_mag = int(np.floor(np.log10(delta_dfdot_start)))
         delta_dfdot = delta_dfdot_start / 10 ** self.dfdot_order_of_mag
 
         delta_dfddot_start = 16 / tobs ** 3
-        self.dfddot_order_of_mag = np.int(np.log10(delta_dfddot_start))
+        self.dfddot_order_of_mag = int(np.floor(np.log10(delta_dfddot_start)))
         delta_dfddot = delta_dfddot_start / 10 ** self.dfddot_order_of_mag
 
         freq_str = r"$\Delta$ F0" "x$10^{" + f"{self.df_order_of_mag}" + r"}$"
@@ -582,7 +905,7 @@ class InteractivePhaseogram(BasePhaseogram):
 
     def update(self, val):
         self._set_lines()
-        self.fig.canvas.draw_idle()
+        self._redraw_animated()
 
     def _read_sliders(self):
         fddot = self.sfddot.val * 10 ** self.dfddot_order_of_mag
@@ -590,19 +913,26 @@ class InteractivePhaseogram(BasePhaseogram):
         freq = self.sfreq.val * 10 ** self.df_order_of_mag
         return freq, fdot, fddot
 
+    def _folded_values(self):
+        # The sliders are differences from the folded parameters
+        return 0, 0, 0
+
     def _line_delay_fun(self, times):
         freq, fdot, fddot = self._read_sliders()
-        return (
-            (times - self.pepoch).astype(np.float64) * freq
-            + 0.5 * (times - self.pepoch) ** 2 * fdot
-            + 1 / 6 * (times - self.pepoch) ** 3 * fddot
-        )
+        if times is self.times:
+            dt = self._dt_lines
+        else:
+            dt = np.asarray(times - self.pepoch, dtype=np.float64)
+        return dt * (freq + dt * (0.5 * fdot + dt * (fddot / 6)))
 
     def _delay_fun(self, times):
         """This is the delay function _without_ frequency derivatives."""
         return 0
 
     def recalculate(self, event):
+        if not self._dirty:
+            self._print_timing_model()
+            return
         dfreq, dfdot, dfddot = self._read_sliders()
         pepoch = self.pepoch
 
@@ -610,7 +940,7 @@ class InteractivePhaseogram(BasePhaseogram):
         self.fdot = self.fdot - dfdot
         self.freq = self.freq - dfreq
 
-        self.unnorm_phaseogr, _, _, _ = normalized_phaseogram(
+        normalized_phaseogram(
             None,
             self.ev_times,
             self.freq,
@@ -620,36 +950,26 @@ class InteractivePhaseogram(BasePhaseogram):
             nt=self.nt,
             pepoch=pepoch,
             fddot=self.fddot,
+            out=self.unnorm_phaseogr.T,
         )
-        self.phaseogr, _, _, _ = normalized_phaseogram(
-            self.norm,
-            self.ev_times,
-            self.freq,
-            fdot=self.fdot,
-            plot=False,
-            nph=self.nph,
-            nt=self.nt,
-            pepoch=pepoch,
-            fddot=self.fddot,
-        )
+        self._cache_profile()
+        self._normalize()
 
         self.reset(1)
 
         self.fig.canvas.draw()
-        self.timing_model_string = self.get_timing_model_string()
-        print("------------------------")
-        print(self.timing_model_string)
-        print("------------------------")
+        self._print_timing_model()
 
     def toa(self, event):
+        from scipy.ndimage import gaussian_filter1d
+        from .fold import get_TOAs_from_events
+
         self.timing_model_string = self.get_timing_model_string()
 
         dfreq, dfdot, dfddot = self._read_sliders()
         freqs = [self.freq - dfreq, self.fdot - dfdot, self.fddot - dfddot]
-        folding_length = np.median(np.diff(self.times))
-        template = gaussian_filter1d(
-            np.sum(np.nan_to_num(self.unnorm_phaseogr), axis=1), sigma=1
-        )
+        folding_length = self._tseg
+        template = gaussian_filter1d(self._prof, sigma=1)
         template = (
             np.roll(template[: template.size // 2], -np.argmax(template))
             / self.nt
@@ -676,9 +996,11 @@ class InteractivePhaseogram(BasePhaseogram):
             corr_string = "_corr"
 
         with open(self.label + corr_string + ".tim", "w") as fobj:
-            print("FORMAT 1", file=fobj)
-            for t, te in zip(toa_corr, toaerr):
-                print("HEN", 0, t, te, "@", file=fobj)
+            # str() keeps the full precision of long double TOAs, like print
+            lines = [
+                f"HEN 0 {t!s} {te!s} @\n" for t, te in zip(toa_corr, toaerr)
+            ]
+            fobj.write("FORMAT 1\n" + "".join(lines))
 
         with open(self.label + ".par", "w") as fobj:
             print(self.timing_model_string, file=fobj)
@@ -732,8 +1054,7 @@ class BinaryPhaseogram(BasePhaseogram):
         self.dasini = 0
         self.dt0 = 0
 
-        tseg = np.median(np.diff(self.times))
-        tobs = tseg * self.nt
+        tobs = self._tobs
 
         delta_period = tobs * 5
         delta_asini = 5 / self.freq
@@ -773,19 +1094,41 @@ class BinaryPhaseogram(BasePhaseogram):
 
     def update(self, val):
         self._set_lines()
-        self.fig.canvas.draw_idle()
+        self._redraw_animated()
 
     def _read_sliders(self):
         return self.speriod.val, self.sasini.val, self.st0.val
 
+    def _folded_values(self):
+        return self.orbital_period, self.asini, self.t0
+
+    def _cache_line_delay(self):
+        """Cache what ``_line_delay_fun`` needs at the phaseogram times."""
+        self._old_line_delay = self.asini * np.sin(
+            2 * np.pi * (self.times - self.t0) / (self.orbital_period)
+        )
+        self._line_delay_buf = np.empty_like(self._old_line_delay)
+
     def _line_delay_fun(self, times):
         orbital_period, asini, t0 = self._read_sliders()
 
-        new_values = asini * np.sin(2 * np.pi * (times - t0) / orbital_period)
-        old_values = self.asini * np.sin(
-            2 * np.pi * (times - self.t0) / (self.orbital_period)
-        )
-        return (new_values - old_values) * self.freq
+        if times is not self.times:
+            new_values = asini * np.sin(
+                2 * np.pi * (times - t0) / orbital_period
+            )
+            old_values = self.asini * np.sin(
+                2 * np.pi * (times - self.t0) / (self.orbital_period)
+            )
+            return (new_values - old_values) * self.freq
+
+        # On every slider move: evaluate in place, on a reused buffer
+        values = np.subtract(times, t0, out=self._line_delay_buf)
+        values *= 2 * np.pi / orbital_period
+        np.sin(values, out=values)
+        values *= asini
+        values -= self._old_line_delay
+        values *= self.freq
+        return values
 
     def _delay_fun(self, times):
         if self.t0 is None:
@@ -798,11 +1141,15 @@ class BinaryPhaseogram(BasePhaseogram):
         )
 
     def recalculate(self, event):
+        if not self._dirty:
+            self._print_timing_model()
+            return
         self.orbital_period, self.asini, self.t0 = self._read_sliders()
+        self._cache_line_delay()
 
         corrected_times = self.ev_times - self._delay_fun(self.ev_times)
 
-        self.unnorm_phaseogr, _, _, _ = normalized_phaseogram(
+        normalized_phaseogram(
             None,
             corrected_times,
             self.freq,
@@ -812,22 +1159,14 @@ class BinaryPhaseogram(BasePhaseogram):
             nt=self.nt,
             pepoch=self.pepoch,
             fddot=self.fddot,
+            out=self.unnorm_phaseogr.T,
         )
+        self._cache_profile()
 
-        self.phaseogr, _, _, _ = normalized_phaseogram(
-            self.norm,
-            corrected_times,
-            self.freq,
-            fdot=self.fdot,
-            plot=False,
-            nph=self.nph,
-            nt=self.nt,
-            pepoch=self.pepoch,
-            fddot=self.fddot,
-        )
+        self._normalize()
 
         self._set_lines(False)
-        self.pcolor.set_array(self.phaseogr.T.ravel())
+        self.pcolor.set_data(self.phaseogr)
         self.sasini.valinit = self.asini
         self.speriod.valinit = self.orbital_period
         self.st0.valinit = self.t0
@@ -835,11 +1174,7 @@ class BinaryPhaseogram(BasePhaseogram):
         self.st0.valmax = self.t0 + self.orbital_period
         self.fig.canvas.draw()
 
-        self.timing_model_string = self.get_timing_model_string()
-
-        print("------------------------")
-        print(self.timing_model_string)
-        print("------------------------")
+        self._print_timing_model()
 
     def quit(self, event):
         plt.close(self.fig)
@@ -848,6 +1183,39 @@ class BinaryPhaseogram(BasePhaseogram):
         return self.orbital_period, self.asini, self.t0
 
 
+class PhaseogramConfig(NamedTuple):
+    """Options of `run_interactive_phaseogram`, in a single object.
+
+    It is the input of `run_interactive_phaseogram_from_config`. Contrary
+    to the command line namespace, it is immutable and hashable.
+
+    Examples
+    --------
+    >>> cfg = PhaseogramConfig("events.nc", 1.1, nbin=32)
+    >>> cfg == PhaseogramConfig("events.nc", 1.1, nbin=32)
+    True
+    >>> len({cfg, cfg._replace(freq=1.2)})
+    2
+    """
+
+    event_file: str
+    freq: float
+    fdot: float = 0
+    fddot: float = 0
+    nbin: int = 64
+    nt: int = 32
+    binary: bool = False
+    test: bool = False
+    binary_parameters: tuple = (None, 0, None)
+    pepoch: float = None
+    norm: str = None
+    plot_only: bool = False
+    deorbit_par: str = None
+    emin: float = None
+    emax: float = None
+    use_cache: bool = False
+
+
 def run_interactive_phaseogram(
     event_file,
     freq,
@@ -864,13 +1232,48 @@ def run_interactive_phaseogram(
     deorbit_par=None,
     emin=None,
     emax=None,
+    use_cache=False,
 ):
+    cfg = PhaseogramConfig(
+        event_file,
+        freq,
+        fdot=fdot,
+        fddot=fddot,
+        nbin=nbin,
+        nt=nt,
+        binary=binary,
+        test=test,
+        binary_parameters=tuple(binary_parameters),
+        pepoch=pepoch,
+        norm=norm,
+        plot_only=plot_only,
+        deorbit_par=deorbit_par,
+        emin=emin,
+        emax=emax,
+        use_cache=use_cache,
+    )
+    return run_interactive_phaseogram_from_config(cfg)
+
+
+def run_interactive_phaseogram_from_config(cfg):
+    """Create the interactive phaseogram described by a `PhaseogramConfig`.
+
+    Same as `run_interactive_phaseogram`, with all the options in ``cfg``.
+    """
     from astropy.io.fits import Header
     from astropy.coordinates import SkyCoord
 
-    events = load_events(event_file)
-    if emin is not None or emax is not None:
-        events, elabel = filter_energy(events, emin, emax)
+    if cfg.use_cache:
+        events = _cached_load_events(cfg.event_file)
+    else:
+        events = load_events(cfg.event_file)
+    if cfg.emin is not None or cfg.emax is not None:
+        events, elabel = filter_energy(events, cfg.emin, cfg.emax)
+    # Only the times are used from now on. Drop the other per-event arrays,
+    # e.g. not to copy them in deorbit_events
+    for attr in ["energy", "pi", "cal_pi"]:
+        if getattr(events, attr, None) is not None:
+            setattr(events, attr, None)
     try:
         header = Header.fromstring(events.header)
         position = SkyCoord(
@@ -883,61 +1286,107 @@ def run_interactive_phaseogram(
     except (KeyError, AttributeError):
         position = name = None
 
-    pepoch_mjd = pepoch
-    if pepoch is None:
+    pepoch_mjd = cfg.pepoch
+    if pepoch_mjd is None:
         pepoch = events.gti[0, 0]
         # pepoch_mjd = pepoch / 86400 + events.mjdref
     else:
         pepoch = (pepoch_mjd - events.mjdref) * 86400
 
-    if binary:
+    if cfg.binary:
         ip = BinaryPhaseogram(
             events.time,
-            freq,
-            nph=nbin,
-            nt=nt,
-            fdot=fdot,
-            test=test,
-            fddot=fddot,
+            cfg.freq,
+            nph=cfg.nbin,
+            nt=cfg.nt,
+            fdot=cfg.fdot,
+            test=cfg.test,
+            fddot=cfg.fddot,
             pepoch=pepoch,
-            orbital_period=binary_parameters[0],
-            asini=binary_parameters[1],
-            t0=binary_parameters[2],
+            orbital_period=cfg.binary_parameters[0],
+            asini=cfg.binary_parameters[1],
+            t0=cfg.binary_parameters[2],
             mjdref=events.mjdref,
             gti=events.gti,
-            label=hen_root(event_file),
-            norm=norm,
+            label=hen_root(cfg.event_file),
+            norm=cfg.norm,
             object=name,
             position=position,
-            plot_only=plot_only,
+            plot_only=cfg.plot_only,
         )
     else:
-        events_save = copy.deepcopy(events)
-        if deorbit_par is not None:
-            events = deorbit_events(events, deorbit_par)
+        time_corr = None
+        if cfg.deorbit_par is not None:
+            # deorbit_events works on a copy: the original times are intact
+            orig_time = events.time
+            events = deorbit_events(events, cfg.deorbit_par)
+            time_corr = orig_time - events.time
 
         ip = InteractivePhaseogram(
             events.time,
-            freq,
-            nph=nbin,
-            nt=nt,
-            fdot=fdot,
-            test=test,
-            fddot=fddot,
+            cfg.freq,
+            nph=cfg.nbin,
+            nt=cfg.nt,
+            fdot=cfg.fdot,
+            test=cfg.test,
+            fddot=cfg.fddot,
             pepoch=pepoch,
             mjdref=events.mjdref,
             gti=events.gti,
-            label=hen_root(event_file),
-            norm=norm,
+            label=hen_root(cfg.event_file),
+            norm=cfg.norm,
             object=name,
             position=position,
-            plot_only=plot_only,
-            time_corr=events_save.time - events.time,
+            plot_only=cfg.plot_only,
+            time_corr=time_corr,
         )
 
     return ip
 
 
+def _resolve_frequency(args):
+    """Initial frequency and derivatives from the command line arguments.
+
+    Parameters
+    ----------
+    args : `argparse.Namespace`
+        The parsed arguments, with the ``periodogram``, ``freq``, ``fdot``,
+        ``fddot`` and ``use_cache`` attributes. The periodogram, if any,
+        takes precedence
+
+    Returns
+    -------
+    frequency, fdot, fddot : float
+        The frequency and its first two derivatives
+
+    Examples
+    --------
+    >>> args = argparse.Namespace(
+    ...     periodogram=None, freq=1.5, fdot=-1e-10, fddot=0, use_cache=False)
+    >>> _resolve_frequency(args)
+    (1.5, -1e-10, 0)
+    >>> args.freq = None
+    >>> _resolve_frequency(args)
+    Traceback (most recent call last):
+    ...
+    ValueError: One of -f or --periodogram arguments MUST be specified
+    """
+    from .io import load_folding_peak_only
+
+    if args.periodogram is not None:
+        peak = load_folding_peak_only(
+            args.periodogram, use_cache=args.use_cache
+        )
+        if peak is None:
+            raise ValueError(f"No peaks found in {args.periodogram}")
+        return float(peak), 0, 0
+    if args.freq is None:
+        raise ValueError(
+            "One of -f or --periodogram arguments MUST be " "specified"
+        )
+    return args.freq, args.fdot, args.fddot
+
+
 def main_phaseogram(args=None):
     description = "Plot an interactive phaseogram"
     from .base import _add_default_args, check_negative_numbers_in_args
@@ -1022,6 +1471,15 @@ def main_phaseogram(args=None):
         default=False,
         action="store_true",
     )
+    parser.add_argument(
+        "--use-cache",
+        help=(
+            "Cache the event arrays, and the peak of pickle periodograms, "
+            "in ~/.cache/hendrics, for faster loading in later runs"
+        ),
+        default=False,
+        action="store_true",
+    )
 
     _add_default_args(
         parser, ["pepoch", "deorbit", "test", "loglevel", "debug"]
@@ -1036,21 +1494,9 @@ def main_phaseogram(args=None):
     log.setLevel(args.loglevel)
 
     with log.log_to_file("HENphaseogram.log"):
-        if args.periodogram is None and args.freq is None:
-            raise ValueError(
-                "One of -f or --periodogram arguments MUST be " "specified"
-            )
-        elif args.periodogram is not None:
-            periodogram = load_folding(args.periodogram)
-            frequency = float(periodogram.peaks[0])
-            fdot = 0
-            fddot = 0
-        else:
-            frequency = args.freq
-            fdot = args.fdot
-            fddot = args.fddot
+        frequency, fdot, fddot = _resolve_frequency(args)
 
-        _ = run_interactive_phaseogram(
+        cfg = PhaseogramConfig(
             args.file,
             freq=frequency,
             fdot=fdot,
@@ -1059,11 +1505,13 @@ def main_phaseogram(args=None):
             nt=args.ntimes,
             test=args.test,
             binary=args.binary,
-            binary_parameters=args.binary_parameters,
+            binary_parameters=tuple(args.binary_parameters),
             pepoch=args.pepoch,
             norm=args.norm,
             plot_only=args.plot_only,
             deorbit_par=args.deorbit_par,
             emin=args.emin,
             emax=args.emax,
+            use_cache=args.use_cache,
         )
+        _ = run_interactive_phaseogram_from_config(cfg)
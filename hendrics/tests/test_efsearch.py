@@ -219,6 +219,67 @@ class TestEFsearch:
         assert os.path.exists(outfile)
         os.unlink(outfile)
 
+    def test_fold_pi_only_integer_energy_map(self, monkeypatch):
+        from matplotlib.figure import Figure
+        from matplotlib.collections import QuadMesh
+
+        events = load_events(self.dum_noe)
+        # Integer PI values produce repeated quantile edges, and empty bins
+        events.pi = np.random.poisson(3, events.time.size)
+        evfile = "events_pi_int" + HEN_FILE_EXTENSION
+        save_events(events, evfile)
+        figures = []
+        monkeypatch.setattr(
+            Figure, "savefig", lambda fig, *args, **kwargs: figures.append(fig)
+        )
+
+        main_fold(
+            [
+                evfile,
+                "-f",
+                str(self.pulse_frequency),
+                "-n",
+                "64",
+                "--test",
+                "--norm",
+                "to1",
+            ]
+        )
+        os.unlink(evfile)
+        (fig,) = figures
+        mesh = [
+            c
+            for ax in fig.axes
+            for c in ax.collections
+            if isinstance(c, QuadMesh)
+        ][0]
+        assert np.isfinite(mesh.norm.vmin) and np.isfinite(mesh.norm.vmax)
+        colors = mesh.to_rgba(mesh.get_array())
+        assert len(np.unique(colors.reshape(-1, 4), axis=0)) > 1
+
+    def test_fold_excludes_events_outside_gtis(self, monkeypatch):
+        from matplotlib.figure import Figure
+
+        events = load_events(self.dum_noe)
+        events.gti = np.array([[self.tstart, self.tend / 2]])
+        evfile = "events_half_gti" + HEN_FILE_EXTENSION
+        save_events(events, evfile)
+        figures = []
+        monkeypatch.setattr(
+            Figure, "savefig", lambda fig, *args, **kwargs: figures.append(fig)
+        )
+
+        main_fold(
+            [evfile, "-f", str(self.pulse_frequency), "-n", "64", "--test"]
+        )
+        os.unlink(evfile)
+        (fig,) = figures
+        # The profile is plotted over two periods
+        profile = fig.axes[0].lines[0].get_ydata()
+        n_good = np.count_nonzero(events.time <= self.tend / 2)
+        assert n_good < events.time.size
+        assert np.sum(profile) == 2 * n_good
+
     def test_fold_invalid(self):
         evfile = self.dum
 
@@ -6,12 +6,15 @@ from stingray.powerspectrum import Powerspectrum, AveragedPowerspectrum
 from stingray.powerspectrum import Crossspectrum, AveragedCrossspectrum
 import numpy as np
 import os
+import copy
 from hendrics.io import load_events, save_events, save_lcurve, load_lcurve
 from hendrics.io import save_data, load_data, save_pds, load_pds
 from hendrics.io import HEN_FILE_EXTENSION, _split_high_precision_number
 from hendrics.io import save_model, load_model, HAS_C256, HAS_NETCDF
 from hendrics.io import _get_additional_data, find_file_in_allowed_paths
 from hendrics.io import save_as_ascii, save_as_qdp
+from hendrics.io import _cached_load_events, EFPeriodogram
+from hendrics.io import save_folding, load_folding, load_folding_peak_only
 
 import pytest
 import glob
@@ -318,6 +321,98 @@ class TestIO:
             shutil.rmtree("bubu")
 
 
+class TestEventCache:
+    """Tests of the on-disk cache of event lists."""
+
+    @classmethod
+    def setup_class(cls):
+        events = EventList(
+            time=np.sort(np.random.uniform(0, 100, 1000)),
+            gti=np.array([[0, 100.0]]),
+            pi=np.random.randint(0, 100, 1000),
+            mjdref=57000.0,
+        )
+        cls.fname = "bubu_cache_ev" + HEN_FILE_EXTENSION
+        save_events(events, cls.fname)
+
+    def test_cached_load_events(self, tmp_path):
+        events = _cached_load_events(self.fname, cache_dir=str(tmp_path))
+        evcached = _cached_load_events(self.fname, cache_dir=str(tmp_path))
+        assert isinstance(evcached.time, np.memmap)
+        assert np.all(evcached.time == events.time)
+        assert np.all(evcached.pi == events.pi)
+        assert np.all(evcached.gti == events.gti)
+        assert evcached.mjdref == events.mjdref
+
+    def test_cached_load_events_invalid_cache(self, tmp_path):
+        _cached_load_events(self.fname, cache_dir=str(tmp_path))
+        (meta_file,) = tmp_path.glob("*.meta.pkl")
+        meta_file.write_bytes(b"not a pickle")
+        events = _cached_load_events(self.fname, cache_dir=str(tmp_path))
+        assert np.all(events.time == load_events(self.fname).time)
+        # The cache was written again
+        evcached = _cached_load_events(self.fname, cache_dir=str(tmp_path))
+        assert isinstance(evcached.time, np.memmap)
+
+    @classmethod
+    def teardown_class(cls):
+        os.unlink(cls.fname)
+
+
+class TestFoldingPeakOnly:
+    """Tests of the partial loading of folding search outputs."""
+
+    @classmethod
+    def setup_class(cls):
+        freq = np.linspace(1, 2, 101)
+        cls.efperiod = EFPeriodogram(
+            freq,
+            np.random.chisquare(2, freq.size),
+            "Z2n",
+            16,
+            2,
+            mjdref=57000.0,
+            segment_size=100.0,
+            peaks=np.array([1.5, 1.25]),
+            peak_stat=np.array([40.0, 30.0]),
+        )
+        cls.fname = "bubu_folding" + HEN_FILE_EXTENSION
+        save_folding(cls.efperiod, cls.fname)
+
+    def test_load_folding_peak_only(self):
+        efperiod = load_folding(self.fname)
+        assert load_folding_peak_only(self.fname) == efperiod.peaks[0]
+
+    def test_load_folding_peak_only_pickle_cache(self, tmp_path):
+        efperiod = copy.deepcopy(self.efperiod)
+        pfile = str(tmp_path / "bubu_folding.p")
+        save_folding(efperiod, pfile)
+        cache_dir = str(tmp_path / "cache")
+        peak = load_folding_peak_only(pfile, cache_dir=cache_dir)
+        assert peak == efperiod.peaks[0]
+        # The cache is opt-in
+        assert not os.path.exists(cache_dir)
+        for _ in range(2):
+            peak = load_folding_peak_only(
+                pfile, use_cache=True, cache_dir=cache_dir
+            )
+            assert peak == efperiod.peaks[0]
+            assert len(os.listdir(cache_dir)) == 1
+        # A modified file is read again
+        efperiod.peaks = None
+        save_folding(efperiod, pfile)
+        stat = os.stat(pfile)
+        os.utime(pfile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        peak = load_folding_peak_only(
+            pfile, use_cache=True, cache_dir=cache_dir
+        )
+        assert peak is None
+
+    @classmethod
+    def teardown_class(cls):
+        os.unlink(cls.fname)
+
+
 class TestIOModel:
     """Real unit tests."""
 
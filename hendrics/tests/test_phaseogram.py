@@ -4,6 +4,8 @@ import numpy as np
 from hendrics.io import save_events, HEN_FILE_EXTENSION, load_folding
 from hendrics.efsearch import main_zsearch
 from hendrics.phaseogram import main_phaseogram, run_interactive_phaseogram
+from hendrics.phaseogram import PhaseogramConfig
+from hendrics.phaseogram import run_interactive_phaseogram_from_config
 from hendrics.base import hen_root
 from hendrics.fold import HAS_PINT
 from hendrics.plot import plot_folding
@@ -168,6 +170,11 @@ class TestPhaseogram:
         assert fdot == 2
         assert f == 9.9
 
+    def test_phaseogram_from_config(self):
+        cfg = PhaseogramConfig(self.dum, 9.9, nbin=16, nt=8, test=True)
+        ip = run_interactive_phaseogram_from_config(cfg)
+        assert (ip.freq, ip.nph, ip.nt) == (9.9, 16, 8)
+
     def test_phaseogram_raises(self):
         evfile = self.dum
         with pytest.raises(ValueError):
@@ -223,6 +230,71 @@ class TestPhaseogram:
         orbital_period, fdot, fddot = ip.get_values()
         assert orbital_period == 2
 
+    def test_phaseogram_zoom_binary(self):
+        evfile = self.dum
+        ip = run_interactive_phaseogram(evfile, 9.9, test=True, binary=True)
+        ip.st0.set_val(ip.st0.val + (ip.st0.valmax - ip.st0.val) / 2)
+        ip.recalculate(1)
+        for zoom, factor in [(ip.zoom_in, 1 / 4), (ip.zoom_out, 1)]:
+            expected = []
+            for s in ip.sliders:
+                valrange = (s.valmax - s.valmin) * factor
+                valmin = max(s.hardvalmin, s.val - valrange)
+                expected.append((s.val, valmin, s.val + valrange))
+            zoom(1)
+            for s, (val, valmin, valmax) in zip(ip.sliders, expected):
+                assert s.val == val
+                assert s.valinit == val
+                assert np.isclose(s.valmin, valmin)
+                assert np.isclose(s.valmax, valmax)
+                assert np.allclose(s.ax.get_xlim(), [valmin, valmax])
+                xy = s.poly.get_xy()
+                assert np.isclose(xy[:, 0].min(), valmin)
+                assert np.isclose(xy[:, 0].max(), val)
+        assert not ip._dirty
+
+    def test_slider_set_range_rebuilds_unknown_patch(self):
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Rectangle
+        from hendrics.phaseogram import SliderOnSteroids
+
+        fig = plt.figure()
+        ax = fig.add_axes([0.1, 0.1, 0.8, 0.1])
+        s = SliderOnSteroids(ax, "a", 0, 1, valinit=0.5, hardvalmin=0)
+        changed = []
+        s.on_changed(changed.append)
+        # As in recent matplotlib versions, where axvspan returns a Rectangle
+        s.poly.remove()
+        s.poly = ax.add_patch(Rectangle((0, 0), 0.5, 1))
+        s.set_range(0.25, 0.75)
+        assert (s.valmin, s.valmax, s.val) == (0.25, 0.75, 0.5)
+        assert s.hardvalmin == 0
+        s.set_val(0.6)
+        assert changed == [0.6]
+        plt.close(fig)
+
+    def test_phaseogram_recalculate_only_if_changed(self):
+        evfile = self.dum
+        ip = run_interactive_phaseogram(evfile, 9.9, test=True, binary=True)
+        phaseogr = ip.phaseogr.copy()
+        ip.recalculate(1)
+        np.testing.assert_array_equal(ip.phaseogr, phaseogr)
+        ip.sasini.set_val(ip.sasini.valmax / 2)
+        ip.recalculate(1)
+        assert not np.allclose(ip.phaseogr, phaseogr, equal_nan=True)
+        assert ip.asini == ip.sasini.valmax / 2
+
+    def test_phaseogram_zoom_reset_recalculate(self):
+        evfile = self.dum
+        ip = run_interactive_phaseogram(evfile, 9.9, test=True)
+        ip.sfreq.set_val(0.5)
+        ip.zoom_in(1)
+        ip.reset(1)
+        # The zoom moved the initial value of the slider
+        assert ip.sfreq.val == 0.5
+        ip.recalculate(1)
+        assert np.isclose(ip.freq, 9.9 - 0.5 * 10 ** ip.df_order_of_mag)
+
     def test_phaseogram_raises_binary(self):
         evfile = self.dum
         with pytest.raises(ValueError):
@@ -231,3 +303,15 @@ class TestPhaseogram:
     @classmethod
     def teardown_class(cls):
         os.unlink(cls.dum)
+
+
+@pytest.mark.parametrize(
+    "norm, func", [("mediannorm", np.median), ("meannorm", np.mean)]
+)
+def test_apply_norm_each_time_bin(norm, func):
+    from hendrics.phaseogram import _apply_norm
+
+    phas = np.random.poisson(100, (32, 8)).astype(float)
+    normed = _apply_norm(phas.copy(), norm)
+    for col, normed_col in zip(phas.T, normed.T):
+        assert np.allclose(normed_col, (col - func(col)) / func(col))